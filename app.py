@@ -3,6 +3,17 @@ import streamlit as st
 import pandas as pd
 import numpy as np
 import plotly.express as px
+from tsdownsample import LTTBDownsampler
+try:
+    # SIMD NaN-reductions; numpy's versions give the same results, just slower
+    from bottleneck import nanmax, nanmean, nanmin
+except ImportError:
+    from numpy import nanmax, nanmean, nanmin
+import pyarrow as pa
+import pyarrow.parquet as pq
+import hashlib
+import json
+import os
 from datetime import datetime, timedelta
 
 st.set_page_config(
@@ -11,29 +22,121 @@ st.set_page_config(
     layout="wide"
 )
 
-@st.cache_data(show_spinner=False)
-def load_data(path: str) -> pd.DataFrame:
-    df = pd.read_excel(path, sheet_name=0, engine="openpyxl")
+def read_sheet(path: str) -> pd.DataFrame:
+    # calamine (Rust) parses xlsx much faster than openpyxl; fall back if it isn't installed
+    try:
+        return pd.read_excel(path, sheet_name=0, engine="calamine")
+    except (ImportError, ValueError):
+        return pd.read_excel(path, sheet_name=0, engine="openpyxl")
+
+# Bump when load_data's output changes so old Parquet caches are ignored
+CACHE_VERSION = "4"
+
+def parse_timestamps(col: pd.Series) -> pd.Series:
+    # Text with UTC offsets must go through UTC (the offsets differ over DST); naive text must not
+    first = col.dropna().iloc[:1]
+    aware = col.dtype == object and len(first) > 0 and pd.Timestamp(first.iat[0]).tzinfo is not None
+    ts = pd.to_datetime(col, utc=aware, cache=True)
+    if ts.dt.tz is None:
+        return ts
+    # PJM local times switch between -04:00 and -05:00 over DST; keep them as naive Eastern wall-clock time
+    return ts.dt.tz_convert("America/New_York").dt.tz_localize(None)
+
+def parse_sheet(path: str):
+    df = read_sheet(path)
     # Normalize time columns
     # Prefer 'interval_start_local' if present, fallback to first datetime-like column
     time_col_candidates = [c for c in df.columns if "interval" in c and "start" in c and "local" in c]
     if len(time_col_candidates) == 0:
-        # try any column that looks like datetime
+        # any column already parsed as datetime, or a text column whose first value parses as one
+        # (only that single value is parsed, never the whole column)
         for c in df.columns:
+            if pd.api.types.is_datetime64_any_dtype(df[c].dtype):
+                time_col_candidates.append(c)
+                continue
+            if df[c].dtype != object:
+                # numbers would "parse" as epoch nanoseconds
+                continue
+            v = df[c].dropna().iloc[:1]
+            if not len(v):
+                continue
             try:
-                pd.to_datetime(df[c])
+                pd.Timestamp(v.iat[0])
                 time_col_candidates.append(c)
             except Exception:
                 pass
     time_col = time_col_candidates[0] if time_col_candidates else df.columns[0]
-    df["timestamp"] = pd.to_datetime(df[time_col])
+    df["timestamp"] = parse_timestamps(df[time_col])
     df = df.sort_values("timestamp").reset_index(drop=True)
     # Numeric columns (zones)
     numeric_cols = df.select_dtypes(include=[np.number]).columns.tolist()
     # Try to keep 'load' and other zone columns
+    # Arrow-backed float32 halves the cached frame; 'timestamp' stays datetime64[ns] (already int64
+    # underneath) because resample needs a DatetimeIndex. The raw text time columns are dropped:
+    # nothing reads them after parsing and they were most of the frame's memory.
+    df = df[["timestamp", *numeric_cols]].astype({c: "float32[pyarrow]" for c in numeric_cols})
     return df, numeric_cols
 
-df, numeric_cols = load_data("data/PJM-ZONE-WISE-LOAD-DATA.xlsx")
+def write_cache(cache_path: str, df: pd.DataFrame, numeric_cols: list) -> None:
+    cache_dir = os.path.dirname(cache_path)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        meta = {**(table.schema.metadata or {}), b"numeric_cols": json.dumps(numeric_cols).encode()}
+        # Write next to the target and rename, so an interrupted load never leaves a partial cache file.
+        # A plain per-process name (not mkstemp) so the file gets the usual umask permissions.
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        try:
+            pq.write_table(table.replace_schema_metadata(meta), tmp_path, compression="zstd")
+            os.replace(tmp_path, cache_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    except (OSError, pa.ArrowException):
+        # Read-only disk or a column Arrow can't store: just skip the cache
+        return
+    # Older versions / earlier xlsx edits are never read again; .tmp files are leftovers from killed writes
+    for name in os.listdir(cache_dir):
+        if name.endswith((".parquet", ".tmp")) and os.path.join(cache_dir, name) != cache_path:
+            try:
+                os.remove(os.path.join(cache_dir, name))
+            except OSError:
+                pass
+
+# One entry: the app only ever loads one file, so don't keep a stale frame around
+@st.cache_data(show_spinner=False, max_entries=1)
+def load_data(path: str):
+    # Parquet cache keyed by the code version and a hash of the xlsx bytes, so a restart skips the Excel parse
+    with open(path, "rb") as f:
+        h = hashlib.blake2b(f.read(), digest_size=16).hexdigest()
+    cache_path = os.path.join(os.path.dirname(path), ".cache", f"v{CACHE_VERSION}-{h}.parquet")
+    df = None
+    if os.path.exists(cache_path):
+        try:
+            table = pq.read_table(cache_path)
+            # The zone list is stored with the file, so a cache hit never scans dtypes
+            meta = table.schema.metadata or {}
+            if b"numeric_cols" in meta:
+                numeric_cols = json.loads(meta[b"numeric_cols"])
+            else:
+                numeric_cols = [f.name for f in table.schema if pa.types.is_integer(f.type) or pa.types.is_floating(f.type)]
+            df = table.to_pandas()
+        except (OSError, pa.ArrowException):
+            # Unreadable cache (e.g. truncated): rebuild it from the xlsx below
+            df = None
+    if df is None:
+        df, numeric_cols = parse_sheet(path)
+        write_cache(cache_path, df, numeric_cols)
+    # Daily and clock-hour averages over the whole file, so those panels don't aggregate per rerun.
+    # Kept as (labels, float32 matrix) with one column per zone in numeric_cols order.
+    daily_all = df.set_index("timestamp")[numeric_cols].resample("1D").mean()
+    hourly_all = df.groupby(df["timestamp"].dt.hour)[numeric_cols].mean()
+    daily = (daily_all.index.to_numpy(), daily_all.to_numpy(dtype=np.float32, na_value=np.nan))
+    hourly = (hourly_all.index.to_numpy(), hourly_all.to_numpy(dtype=np.float32, na_value=np.nan))
+    return df, numeric_cols, daily, hourly
+
+df, numeric_cols, (daily_days, daily_arr), (hourly_hours, hourly_arr) = load_data("data/PJM-ZONE-WISE-LOAD-DATA.xlsx")
+zone_index = {c: i for i, c in enumerate(numeric_cols)}
 
 # -------------- Header --------------
 st.markdown("### ⚡ PJM Zone-wise Load — Dark Insight Dashboard")
@@ -71,12 +174,51 @@ with st.sidebar:
         help="Group data into bigger time buckets to smooth the lines."
     )
 
-# Filter time
-mask = (df["timestamp"] >= pd.Timestamp(start)) & (df["timestamp"] <= pd.Timestamp(end))
-view = df.loc[mask].copy()
+# Filter time + resample (cached so widgets that don't touch the window skip this work)
+# `df` is read as a module global so it isn't hashed on every call
+def window_bounds(start64: np.datetime64, end64: np.datetime64) -> tuple:
+    # df is sorted by timestamp (see load_data), so the window is one contiguous slice
+    ts = df["timestamp"].values
+    lo = ts.searchsorted(start64)
+    hi = ts.searchsorted(end64, side="right")
+    return int(lo), int(hi)
 
-# Resample
-view = view.set_index("timestamp").resample(resample_rule).mean(numeric_only=True).reset_index()
+@st.cache_data(show_spinner=False)
+def build_view(lo: int, hi: int, rule: str, cols: tuple) -> pd.DataFrame:
+    return df.iloc[lo:hi][["timestamp", *cols]].set_index("timestamp").resample(rule).mean().reset_index()
+
+# Top/Bottom needs every zone but not the resample rule. Averaging the raw rows (not the
+# resampled buckets) keeps partial first/last buckets from being over-weighted.
+@st.cache_data(show_spinner=False)
+def zone_means_for_window(lo: int, hi: int) -> pd.Series:
+    return df.iloc[lo:hi][numeric_cols].mean().sort_values(ascending=False)
+
+# Keep at most ~n_out points per trace (LTTB) so the browser isn't sent every bucket
+def downsample(frame: pd.DataFrame, cols, n_out: int = 2000) -> pd.DataFrame:
+    if len(frame) <= n_out:
+        return frame
+    x = frame["timestamp"].values.view("int64")
+    keep = set()
+    for c in cols:
+        y = frame[c].to_numpy(dtype=np.float64)
+        missing = np.isnan(y)
+        # Keep the first row of every NaN run so gaps still break the line after downsampling
+        gap_starts = np.flatnonzero(missing & ~np.concatenate(([False], missing[:-1])))
+        keep.update(gap_starts.tolist())
+        valid = np.flatnonzero(~missing)
+        if len(valid) <= n_out:
+            keep.update(valid.tolist())
+            continue
+        idx = LTTBDownsampler().downsample(x[valid], y[valid], n_out=n_out)
+        keep.update(valid[idx].tolist())
+    return frame.iloc[sorted(keep)]
+
+# Only resample what the charts/KPIs read: the picked zones plus 'pjm_rto' (all zones if neither)
+view_cols = tuple(c for c in numeric_cols if c in selected_zones or c == "pjm_rto") or tuple(numeric_cols)
+# Window bounds as datetime64[ns] once per rerun, matching the timestamp column's dtype
+start64, end64 = np.datetime64(start, "ns"), np.datetime64(end, "ns")
+lo, hi = window_bounds(start64, end64)
+view = build_view(lo, hi, resample_rule, view_cols)
 
 # -------------- KPI Cards --------------
 kpi_cols = st.columns(4)
@@ -91,26 +233,37 @@ def kpi_card(col, label, value, suffix=""):
         unsafe_allow_html=True
     )
 
-# Compute KPIs for 'pjm_rto' if present, else use overall mean of selected zones
-def series_for_kpis(df_view: pd.DataFrame) -> pd.Series:
-    target = None
-    if "pjm_rto" in df_view.columns:
-        target = df_view["pjm_rto"]
-    elif selected_zones:
-        target = df_view[selected_zones].sum(axis=1)
+# Compute KPIs for 'pjm_rto' if present, else the total of the selected zones (all zones if none)
+def kpi_target_cols() -> tuple:
+    if "pjm_rto" in numeric_cols:
+        return ("pjm_rto",)
+    return tuple(c for c in numeric_cols if c in selected_zones) or tuple(numeric_cols)
+
+# Keyed on the KPI columns rather than the whole view, so with 'pjm_rto' present only window
+# and resample changes recompute this (not the zone picker or Top-N)
+@st.cache_data(show_spinner=False)
+def kpis(lo: int, hi: int, rule: str, target_cols: tuple):
+    frame = build_view(lo, hi, rule, target_cols)
+    if target_cols == ("pjm_rto",):
+        target = frame["pjm_rto"]
     else:
-        target = df_view[numeric_cols].sum(axis=1)
-    return target
-
-target = series_for_kpis(view)
-if not target.empty:
-    kpi_card(kpi_cols[0], "Peak Load", f"{target.max():,.0f}", " MW")
-    kpi_card(kpi_cols[1], "Lowest Load", f"{target.min():,.0f}", " MW")
-    kpi_card(kpi_cols[2], "Average Load", f"{target.mean():,.0f}", " MW")
+        target = frame[list(target_cols)].sum(axis=1)
+    arr = target.to_numpy(dtype=np.float64, na_value=np.nan)
+    if len(arr) == 0:
+        return None
     # Simple percent change from first to last
+    first, last = arr[0], arr[-1]
     pct = np.nan
-    if len(target) >= 2 and target.iloc[0] != 0:
-        pct = ((target.iloc[-1] - target.iloc[0]) / abs(target.iloc[0])) * 100
+    if len(arr) >= 2 and first != 0:
+        pct = ((last - first) / abs(first)) * 100
+    return nanmax(arr), nanmin(arr), nanmean(arr), pct
+
+kpi_values = kpis(lo, hi, resample_rule, kpi_target_cols())
+if kpi_values is not None:
+    peak, lowest, avg, pct = kpi_values
+    kpi_card(kpi_cols[0], "Peak Load", f"{peak:,.0f}", " MW")
+    kpi_card(kpi_cols[1], "Lowest Load", f"{lowest:,.0f}", " MW")
+    kpi_card(kpi_cols[2], "Average Load", f"{avg:,.0f}", " MW")
     kpi_card(kpi_cols[3], "Change (Start→End)", f"{pct:,.1f}%", "")
 
 st.markdown("---")
@@ -122,28 +275,41 @@ left, right = st.columns([2, 1])
 with left:
     st.subheader("Trend Over Time")
     if selected_zones:
-        melted = view.melt(id_vars="timestamp", value_vars=selected_zones, var_name="Zone", value_name="Load (MW)")
-        fig = px.line(
-            melted,
-            x="timestamp",
-            y="Load (MW)",
-            color="Zone",
-            markers=False,
-            title="Electricity Load by Zone",
-        )
-        fig.update_layout(
-            template="plotly_dark",
-            margin=dict(l=10, r=10, t=40, b=10),
-            height=420
-        )
+        data = downsample(view, selected_zones)
+        # Reuse the figure across reruns while the zone list is unchanged; only trace data is swapped
+        fig = st.session_state.get("trend_fig")
+        if fig is None or st.session_state.get("trend_zones") != selected_zones:
+            # Wide format: one trace per zone column, no melt into a long frame.
+            # Always WebGL so dense windows draw on the GPU instead of as SVG paths.
+            fig = px.line(
+                data,
+                x="timestamp",
+                y=selected_zones,
+                labels={"value": "Load (MW)", "variable": "Zone"},
+                markers=False,
+                render_mode="webgl",
+                title="Electricity Load by Zone",
+            )
+            fig.update_layout(
+                template="plotly_dark",
+                margin=dict(l=10, r=10, t=40, b=10),
+                height=420
+            )
+            st.session_state["trend_fig"] = fig
+            st.session_state["trend_zones"] = list(selected_zones)
+        else:
+            with fig.batch_update():
+                for trace in fig.data:
+                    trace.x = data["timestamp"].to_numpy()
+                    trace.y = data[trace.name].to_numpy()
         st.plotly_chart(fig, use_container_width=True)
     else:
         st.info("Pick at least one zone in the sidebar.")
 
 # Top/Bottom zones (by average within window)
-with right:
-    st.subheader("Top & Bottom Zones (Avg)")
-    zone_means = view[numeric_cols].mean(numeric_only=True).sort_values(ascending=False)
+# A fragment, so moving the Top-N slider only reruns this panel
+@st.fragment
+def top_bottom_panel(zone_means: pd.Series):
     top_n = st.slider("How many to show", 3, 10, 5)
     top_df = zone_means.head(top_n).reset_index()
     top_df.columns = ["Zone", "Avg Load (MW)"]
@@ -156,6 +322,10 @@ with right:
     fig_bar_bottom.update_layout(template="plotly_dark", height=280, margin=dict(l=10, r=10, t=40, b=10))
     st.plotly_chart(fig_bar_bottom, use_container_width=True)
 
+with right:
+    st.subheader("Top & Bottom Zones (Avg)")
+    top_bottom_panel(zone_means_for_window(lo, hi))
+
 st.markdown("---")
 
 # -------------- Daily patterns --------------
@@ -163,26 +333,31 @@ col1, col2 = st.columns(2)
 
 with col1:
     st.subheader("Daily Average (Which day is highest?)")
-    day = view.set_index("timestamp").resample("1D").mean(numeric_only=True).reset_index()
-    if "pjm_rto" in day.columns:
+    if "pjm_rto" in view.columns:
         ycol = "pjm_rto"
     else:
         ycol = selected_zones[0] if selected_zones else numeric_cols[0]
+    d_lo = daily_days.searchsorted(start64.astype("datetime64[D]"))
+    d_hi = daily_days.searchsorted(end64, side="right")
+    day = pd.DataFrame({"timestamp": daily_days[d_lo:d_hi], ycol: daily_arr[d_lo:d_hi, zone_index[ycol]]})
     fig_day = px.bar(day, x="timestamp", y=ycol, title=f"Daily Average Load — {ycol}")
     fig_day.update_layout(template="plotly_dark", height=350, margin=dict(l=10, r=10, t=40, b=10))
     st.plotly_chart(fig_day, use_container_width=True)
 
 with col2:
     st.subheader("Hourly Pattern (Typical day shape)")
-    # Compute average by clock hour
-    tmp = view.copy()
-    tmp["hour"] = pd.to_datetime(tmp["timestamp"]).dt.hour
-    if "pjm_rto" in tmp.columns:
+    # Average by clock hour over the whole dataset
+    if "pjm_rto" in view.columns:
         ycol2 = "pjm_rto"
     else:
         ycol2 = selected_zones[0] if selected_zones else numeric_cols[0]
-    hourly = tmp.groupby("hour")[ycol2].mean().reset_index()
-    fig_hour = px.line(hourly, x="hour", y=ycol2, markers=True, title=f"Average by Hour — {ycol2}")
+    fig_hour = px.line(
+        x=hourly_hours,
+        y=hourly_arr[:, zone_index[ycol2]],
+        labels={"x": "hour", "y": ycol2},
+        markers=True,
+        title=f"Average by Hour — {ycol2}",
+    )
     fig_hour.update_layout(template="plotly_dark", height=350, margin=dict(l=10, r=10, t=40, b=10))
     st.plotly_chart(fig_hour, use_container_width=True)
 